@@ -1,4 +1,9 @@
 """Block CliticFeats extracts features for Czech clitic 'se'."""
+import sys
+from bisect import bisect_left
+from collections import namedtuple
+from operator import attrgetter
+
 from udapi.core.block import Block
 
 
@@ -7,6 +12,38 @@ from udapi.core.block import Block
 # of modal/phase verbs (musí, začal, nechal, …) which together form a complex
 # predicate, NOT a separate dependent clause.
 _SUBORDINATING_DEPRELS = {"ccomp", "advcl", "acl", "csubj"}
+
+# Base deprels that decide the clause type in CliticFeats._clause_type; all
+# other deprels are passed through on the way up the tree.
+_CLAUSE_TYPE_BY_DEPREL = {
+    "root": "HV",
+    **dict.fromkeys(_SUBORDINATING_DEPRELS, "VV"),
+}
+
+# Memo of full deprel → universal part (``obl:arg`` → ``obl``). The number of
+# distinct deprel strings in a treebank is small, so the cache stays tiny.
+_BASE_DEPREL_CACHE = {}
+
+# All casings of the lemma *se*; avoids lowercasing the lemma of every token.
+_SE_LEMMAS = frozenset(("se", "Se", "sE", "SE"))
+
+# Lemmas of the clitics (besides se) that join a clitic group: short forms of
+# personal pronouns and present/conditional forms of the auxiliary být.
+_GROUP_CLITIC_LEMMAS = frozenset(("on", "já", "ty", "být"))
+
+# C-level key/accessor functions for sorting and joining nodes.
+_ORD = attrgetter("ord")
+_FORM = attrgetter("form")
+
+# Complex predicate of a governing verb: its ``nodes`` in sentence order (see
+# CliticFeats._predicate_form), their ids, and the ``clause_root`` – the top of
+# the xcomp chain, whose subtree forms the clause.
+_PredicateInfo = namedtuple("_PredicateInfo", ["nodes", "node_ids", "clause_root"])
+
+# Number of output lines buffered before they are written to stdout.
+_FLUSH_EVERY = 1024
+
+
 class CliticFeats(Block):
     """Extract features for the Czech clitic *se* (not a preposition).
 
@@ -30,45 +67,87 @@ class CliticFeats(Block):
     A header line is printed at the beginning of the output.
     """
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._buf = []
+
     def process_start(self):
-        print(
-            "sent_id\tord\tsentence\tpredicate_form\tclause_type\tclause_position\trelation_to_regent"
+        sys.stdout.write(
+            "sent_id\tord\tsentence\tpredicate_form\tclause_type\tclause_position\trelation_to_regent\n"
         )
 
-    def process_node(self, node):
-        if not self._is_target_se_clitic(node):
-            return
+    def process_end(self):
+        self._flush()
+
+    def process_tree(self, tree):
+        # Iterating here instead of in process_node saves a method dispatch
+        # per token; the lemma test is a cheap prefilter of the full check.
+        sent_id = tree.sent_id or ""
+        forms = None
+        for node in tree.descendants:
+            if node.lemma in _SE_LEMMAS and self._is_target_se_clitic(node):
+                # The sentence forms are shared by all se in the tree.
+                if forms is None:
+                    forms = [token.form for token in tree.descendants]
+                self._process_se(node, sent_id, forms)
+
+    def _process_se(self, node, sent_id, forms=None):
+        """Buffer the feature line of the target *se* clitic *node*."""
         predicate = node.parent
-        predicate_form = self._predicate_form(predicate)
-        clause_type = self._clause_type(predicate)
-        clitic_group = self._clitic_group(node, predicate)
-        clause_position = self._clause_position(predicate, clitic_group)
-        relation_to_regent = self._relation_to_regent(predicate, clitic_group)
-        sent_id = node.root.sent_id or ""
-        sentence = self._sentence_with_marked_se(node)
-        print(
+        sentence = self._sentence_with_marked_se(node, forms)
+        if predicate is None or predicate.is_root():
+            # All features are undefined without a governing predicate.
+            self._emit(f"{sent_id}\t{node.ord}\t{sentence}\t_\t_\t_\t_\n")
+            return
+        # The xcomp chain, clause tokens and clause units are shared by the
+        # helpers, so they are computed only once per se.
+        pred_info = self._predicate_info(predicate)
+        predicate_form = self._predicate_form(predicate, pred_info)
+        clause_type = self._clause_type(predicate, pred_info)
+        clause_tokens = self._clause_tokens(predicate, pred_info)
+        clitic_group = self._clitic_group(node, predicate, clause_tokens)
+        clause_units = self._clause_units(clause_tokens, clitic_group)
+        clause_position = self._clause_position(predicate, clitic_group, clause_units)
+        relation_to_regent = self._relation_to_regent(
+            predicate, clitic_group, clause_units, pred_info
+        )
+        self._emit(
             f"{sent_id}\t{node.ord}\t{sentence}\t{predicate_form}\t{clause_type}\t"
-            f"{clause_position}\t{relation_to_regent}"
+            f"{clause_position}\t{relation_to_regent}\n"
         )
 
+    def _emit(self, line):
+        """Buffer an output *line*, writing the buffer out when it is full."""
+        self._buf.append(line)
+        if len(self._buf) >= _FLUSH_EVERY:
+            self._flush()
+
+    def _flush(self):
+        """Write the buffered output lines to stdout."""
+        if self._buf:
+            sys.stdout.write("".join(self._buf))
+            self._buf.clear()
+
     # ------------------------------------------------------------------
     # helpers
     # ------------------------------------------------------------------
 
     @staticmethod
-    def _sentence_with_marked_se(se_node):
-        """Return the full sentence text with *se_node* wrapped in ``<>``."""
-        tokens = se_node.root.descendants
-        parts = []
-        for token in tokens:
-            form = token.form
-            if token is se_node:
-                form = f"<{form}>"
-            parts.append(form)
+    def _sentence_with_marked_se(se_node, forms=None):
+        """Return the full sentence text with *se_node* wrapped in ``<>``.
+
+        *forms* are the forms of all tokens of the sentence in order; they are
+        collected if not given.
+        """
+        if forms is None:
+            forms = [token.form for token in se_node.root.descendants]
+        parts = list(forms)
+        idx = se_node.ord - 1
+        parts[idx] = f"<{parts[idx]}>"
         return " ".join(parts)
 
     @staticmethod
-    def _predicate_form(predicate):
+    def _predicate_form(predicate, pred_info=None):
         """Return space-joined forms of the complex predicate in sentence order.
 
         The complex predicate consists of:
@@ -80,36 +159,12 @@ class CliticFeats(Block):
         """
         if predicate is None or predicate.is_root():
             return "_"
-        parts = [predicate]
-        for child in predicate.children:
-            base_deprel = child.deprel.split(":")[0] if child.deprel else ""
-            if base_deprel in ("aux", "cop"):
-                parts.append(child)
-
-        # Climb through xcomp chain: each xcomp head is part of the complex
-        # predicate (e.g. "musí se opírat" → forms: musí opírat).
-        visited = {predicate}
-        node = predicate
-        while True:
-            base_deprel = node.deprel.split(":")[0] if node.deprel else ""
-            if base_deprel != "xcomp" or node.parent is None or node.parent.is_root():
-                break
-            head = node.parent
-            if head in visited:
-                break
-            visited.add(head)
-            parts.append(head)
-            for child in head.children:
-                base_ch = child.deprel.split(":")[0] if child.deprel else ""
-                if base_ch in ("aux", "cop"):
-                    parts.append(child)
-            node = head
-
-        parts.sort(key=lambda n: n.ord)
-        return " ".join(part.form for part in parts)
+        if pred_info is None:
+            pred_info = CliticFeats._predicate_info(predicate)
+        return " ".join(map(_FORM, pred_info.nodes))
 
     @staticmethod
-    def _clause_type(predicate):
+    def _clause_type(predicate, pred_info=None):
         """Return ``HV`` (main clause) or ``VV`` (dependent clause).
 
         Starting at *predicate*, the method walks up the dependency tree.
@@ -124,48 +179,57 @@ class CliticFeats(Block):
         """
         if predicate is None or predicate.is_root():
             return "_"
-        visited = set()
-        node = predicate
+        if pred_info is None:
+            pred_info = CliticFeats._predicate_info(predicate)
+        # The xcomp chain up to the clause root is transparent, so the walk
+        # can start right there.
+        node = slow = pred_info.clause_root
+        step = False
         while True:
-            if node in visited:
-                return "HV"  # cycle guard – treat as main clause
-            visited.add(node)
-            base_deprel = node.deprel.split(":")[0] if node.deprel else ""
-            if base_deprel == "root":
-                return "HV"
-            if base_deprel in _SUBORDINATING_DEPRELS:
-                return "VV"
+            clause_type = _CLAUSE_TYPE_BY_DEPREL.get(CliticFeats._base_deprel(node))
+            if clause_type is not None:
+                return clause_type
             if node.parent is None or node.parent.is_root():
                 return "HV"
             node = node.parent
+            if step:
+                slow = slow.parent
+            step = not step
+            if node is slow:
+                return "HV"  # cycle guard – treat as main clause
 
     @staticmethod
-    def _clitic_group(node, predicate):
-        """Return contiguous clitic-group nodes containing *node* (incl. se)."""
+    def _clitic_group(node, predicate, clause_tokens=None):
+        """Return contiguous clitic-group nodes containing *node* (incl. se).
+
+        *clause_tokens* are the non-punctuation nodes of the clause of
+        *predicate*; they are computed if not given.
+        """
         if node is None:
             return []
-        clause_nodes = CliticFeats._clause_nodes(predicate)
-        if not clause_nodes:
-            return [node]
-        non_punct = [n for n in clause_nodes if getattr(n, "upos", "") != "PUNCT"]
-        try:
-            idx = non_punct.index(node)
-        except ValueError:
+        if clause_tokens is None:
+            clause_tokens = CliticFeats._clause_tokens(predicate)
+        # Clause tokens are sorted by ord, so *node* can be found by bisection.
+        idx = bisect_left(clause_tokens, node.ord, key=_ORD)
+        if idx == len(clause_tokens) or clause_tokens[idx] is not node:
             return [node]
 
         start = idx
-        while start > 0 and CliticFeats._is_group_clitic(non_punct[start - 1]):
+        while start > 0 and CliticFeats._is_group_clitic(clause_tokens[start - 1]):
             start -= 1
         end = idx
-        while end + 1 < len(non_punct) and CliticFeats._is_group_clitic(non_punct[end + 1]):
+        while end + 1 < len(clause_tokens) and CliticFeats._is_group_clitic(clause_tokens[end + 1]):
             end += 1
-        return non_punct[start:end + 1]
+        return clause_tokens[start:end + 1]
 
     @staticmethod
-    def _clause_position(predicate, clitic_group):
+    def _clause_position(predicate, clitic_group, clause_units=None):
         """Return position of the whole clitic group in clause."""
-        clause_nodes = CliticFeats._clause_nodes(predicate)
-        units, group_idx = CliticFeats._clause_units(clause_nodes, clitic_group)
+        if clause_units is None:
+            clause_units = CliticFeats._clause_units(
+                CliticFeats._clause_tokens(predicate), clitic_group
+            )
+        units, group_idx = clause_units
         if group_idx is None:
             return "_"
         if group_idx == 0:
@@ -179,10 +243,13 @@ class CliticFeats(Block):
         return "DelP: mediální"
 
     @staticmethod
-    def _relation_to_regent(predicate, clitic_group):
+    def _relation_to_regent(predicate, clitic_group, clause_units=None, pred_info=None):
         """Return relation of the whole clitic group to governing predicate."""
-        clause_nodes = CliticFeats._clause_nodes(predicate)
-        units, group_idx = CliticFeats._clause_units(clause_nodes, clitic_group)
+        if clause_units is None:
+            clause_units = CliticFeats._clause_units(
+                CliticFeats._clause_tokens(predicate), clitic_group
+            )
+        units, group_idx = clause_units
         if group_idx is None or predicate is None or predicate not in units:
             return "_"
         pred_idx = units.index(predicate)
@@ -191,26 +258,43 @@ class CliticFeats(Block):
         if group_idx == pred_idx + 1:
             return "kontaktní postverbální"
 
-        complex_predicate = set(CliticFeats._predicate_nodes(predicate))
+        if pred_info is None:
+            pred_info = CliticFeats._predicate_info(predicate)
+        complex_predicate_ids = pred_info.node_ids
         left = units[group_idx - 1] if group_idx > 0 else None
         right = units[group_idx + 1] if group_idx + 1 < len(units) else None
-        if left in complex_predicate and right in complex_predicate:
+        if id(left) in complex_predicate_ids and id(right) in complex_predicate_ids:
             return "kontaktní interverbální"
         if group_idx < pred_idx:
             return "izolovaná"
         return "jiné"
 
+    @staticmethod
+    def _base_deprel(node):
+        """Return the universal part of the deprel of *node* (memoized)."""
+        deprel = getattr(node, "deprel", "") or ""
+        base = _BASE_DEPREL_CACHE.get(deprel)
+        if base is None:
+            base = _BASE_DEPREL_CACHE[deprel] = deprel.split(":")[0]
+        return base
+
     @staticmethod
     def _is_group_clitic(node):
         if node is None:
             return False
-        feats = CliticFeats._parse_feats(getattr(node, "feats", ""))
-        lemma = (getattr(node, "lemma", "") or "").lower()
         upos = getattr(node, "upos", "")
-        deprel = (getattr(node, "deprel", "") or "").split(":")[0]
-
+        # Only pronouns and auxiliaries can be group clitics; reject all other
+        # tokens before any lemma or feats processing.
+        if upos != "PRON" and upos != "AUX":
+            return False
         if CliticFeats._is_target_se_clitic(node):
             return True
+        lemma = (getattr(node, "lemma", "") or "").lower()
+        if lemma not in _GROUP_CLITIC_LEMMAS:
+            return False
+        feats = CliticFeats._parse_feats(getattr(node, "feats", ""))
+        deprel = CliticFeats._base_deprel(node)
+
         if (
             upos == "PRON"
             and lemma in {"on", "já", "ty"}
@@ -237,13 +321,15 @@ class CliticFeats(Block):
 
     @staticmethod
     def _is_target_se_clitic(node):
-        if node is None:
+        # Cheap tests first: this runs for every token, so the feats are
+        # parsed only for reflexive pronouns.
+        if node is None or getattr(node, "upos", "") != "PRON":
+            return False
+        if getattr(node, "lemma", "") not in _SE_LEMMAS:
             return False
         feats = CliticFeats._parse_feats(getattr(node, "feats", ""))
         return (
-            getattr(node, "upos", "") == "PRON"
-            and (getattr(node, "lemma", "") or "").lower() == "se"
-            and feats.get("Reflex") == "Yes"
+            feats.get("Reflex") == "Yes"
             and feats.get("PronType") == "Prs"
             and feats.get("Variant") == "Short"
         )
@@ -266,86 +352,77 @@ class CliticFeats(Block):
         return parsed
 
     @staticmethod
-    def _predicate_nodes(predicate):
+    def _predicate_info(predicate):
+        """Return the :data:`_PredicateInfo` of *predicate*."""
         if predicate is None or predicate.is_root():
-            return []
+            return _PredicateInfo([], frozenset(), None)
         parts = [predicate]
         for child in predicate.children:
-            base_deprel = child.deprel.split(":")[0] if child.deprel else ""
+            base_deprel = CliticFeats._base_deprel(child)
             if base_deprel in ("aux", "cop"):
                 parts.append(child)
-        visited = {predicate}
-        node = predicate
+
+        # Climb through xcomp chain: each xcomp head is part of the complex
+        # predicate (e.g. "musí se opírat" → forms: musí opírat).
+        # Cycle guard (Floyd): *slow* follows the climb at half speed, so
+        # it can only be caught up with if the parent chain loops. By then
+        # part of the loop has been collected twice, which is undone below.
+        clause_root = node = slow = predicate
+        step = False
         while True:
-            base_deprel = node.deprel.split(":")[0] if node.deprel else ""
+            base_deprel = CliticFeats._base_deprel(node)
             if base_deprel != "xcomp" or node.parent is None or node.parent.is_root():
+                clause_root = node
                 break
             head = node.parent
-            if head in visited:
+            if step:
+                slow = slow.parent
+            step = not step
+            if head is slow:
+                parts = list({id(n): n for n in parts}.values())
                 break
-            visited.add(head)
             parts.append(head)
             for child in head.children:
-                base_ch = child.deprel.split(":")[0] if child.deprel else ""
+                base_ch = CliticFeats._base_deprel(child)
                 if base_ch in ("aux", "cop"):
                     parts.append(child)
             node = head
-        return sorted(parts, key=lambda n: n.ord)
+
+        parts.sort(key=_ORD)
+        return _PredicateInfo(parts, frozenset(map(id, parts)), clause_root)
 
     @staticmethod
-    def _clause_nodes(predicate):
-        clause_root = CliticFeats._clause_root(predicate)
+    def _clause_nodes(predicate, pred_info=None):
+        if pred_info is None:
+            pred_info = CliticFeats._predicate_info(predicate)
+        clause_root = pred_info.clause_root
         if clause_root is None or clause_root.is_root():
             return []
-        return sorted(CliticFeats._collect_subtree_nodes(clause_root), key=lambda n: n.ord)
+        # udapi materializes the subtree already sorted by ord.
+        return clause_root.descendants(add_self=True)
 
     @staticmethod
-    def _clause_root(predicate):
-        if predicate is None or predicate.is_root():
-            return None
-        node = predicate
-        visited = set()
-        while node is not None and not node.is_root():
-            if node in visited:
-                break
-            visited.add(node)
-            base_deprel = node.deprel.split(":")[0] if node.deprel else ""
-            if base_deprel != "xcomp" or node.parent is None or node.parent.is_root():
-                return node
-            node = node.parent
-        return predicate
+    def _clause_tokens(predicate, pred_info=None):
+        """Return the clause nodes of *predicate* without punctuation."""
+        return [
+            n for n in CliticFeats._clause_nodes(predicate, pred_info)
+            if getattr(n, "upos", "") != "PUNCT"
+        ]
 
     @staticmethod
-    def _collect_subtree_nodes(root):
-        nodes = []
-        stack = [root]
-        seen = set()
-        while stack:
-            node = stack.pop()
-            if node in seen:
-                continue
-            seen.add(node)
-            nodes.append(node)
-            stack.extend(reversed(list(node.children)))
-        return nodes
-
-    @staticmethod
-    def _clause_units(clause_nodes, clitic_group):
-        non_punct = [n for n in clause_nodes if getattr(n, "upos", "") != "PUNCT"]
-        group_set = set(clitic_group or [])
+    def _clause_units(clause_tokens, clitic_group):
+        # Membership by identity keeps the loop off any Python-level
+        # __hash__/__eq__ of the node class.
+        group_ids = {id(n) for n in (clitic_group or ())}
         units = []
         group_idx = None
-        i = 0
-        while i < len(non_punct):
-            node = non_punct[i]
-            if node in group_set:
+        # The whole clitic group collapses into a single unit at the place of
+        # its first member.
+        for node in clause_tokens:
+            if id(node) in group_ids:
                 if group_idx is None:
                     group_idx = len(units)
                     units.append("__CLITIC_GROUP__")
-                i += 1
-                while i < len(non_punct) and non_punct[i] in group_set:
-                    i += 1
-                continue
-            units.append(node)
-            i += 1
+            else:
+                units.append(node)
         return units, group_idx
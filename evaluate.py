@@ -3,8 +3,9 @@
 
 import argparse
 import sys
+from itertools import islice
 
-from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+import numpy as np
 
 
 def parse_args():
@@ -33,10 +34,68 @@ def parse_args():
 
 
 def read_labels(path, skip):
-    with open(path, encoding="utf-8") as f:
-        lines = f.readlines()
     skip_set = set(skip)
-    return [line.rstrip("\n") for i, line in enumerate(lines) if i not in skip_set]
+    # Lines past the last skipped one need no membership test. Negative
+    # numbers match no line, so they do not extend the tested prefix.
+    last_skip = max((i for i in skip_set if i >= 0), default=-1)
+    with open(path, encoding="utf-8") as f:
+        labels = [
+            line.rstrip("\n")
+            for i, line in enumerate(islice(f, last_skip + 1))
+            if i not in skip_set
+        ]
+        labels.extend(line.rstrip("\n") for line in f)
+    return labels
+
+
+def confusion_matrix(gold, predicted):
+    """Return the sorted labels and the confusion matrix of the two label lists.
+
+    Rows of the matrix correspond to gold labels, columns to predicted ones.
+    """
+    labels = sorted(set(gold).union(predicted))
+    label_ids = {label: i for i, label in enumerate(labels)}
+    k = len(labels)
+    # Each (gold, predicted) pair becomes a single cell index g * k + p.
+    cells = [label_ids[g] * k + label_ids[p] for g, p in zip(gold, predicted)]
+    cm = np.bincount(cells, minlength=k * k).reshape(k, k)
+    return labels, cm
+
+
+def classification_report(labels, cm, digits=2):
+    """Return a per-class precision/recall/F1 report computed from *cm*.
+
+    The layout follows ``sklearn.metrics.classification_report``; undefined
+    scores (no predictions or no gold examples of a class) count as 0.
+    """
+    tp = np.diag(cm)
+    support = cm.sum(axis=1)
+    precision = tp / np.maximum(cm.sum(axis=0), 1)
+    recall = tp / np.maximum(support, 1)
+    # 2 * tp / (2 * tp + fp + fn), as sklearn computes it; deriving F1 from
+    # the rounded precision and recall can differ in the last printed digit.
+    f1 = 2 * tp / np.maximum(cm.sum(axis=0) + support, 1)
+    total = support.sum()
+
+    headers = ["precision", "recall", "f1-score", "support"]
+    width = max(max(len(label) for label in labels), len("weighted avg"), digits)
+    row_fmt = "{:>{width}s} " + " {:>9.{digits}f}" * 3 + " {:>9}\n"
+    report = ("{:>{width}s} " + " {:>9}" * len(headers)).format("", *headers, width=width)
+    report += "\n\n"
+    for row in zip(labels, precision, recall, f1, support):
+        report += row_fmt.format(*row, width=width, digits=digits)
+    report += "\n"
+    report += ("{:>{width}s} " + " {:>9}" * 2 + " {:>9.{digits}f} {:>9}\n").format(
+        "accuracy", "", "", tp.sum() / total, total, width=width, digits=digits
+    )
+    scores = np.vstack([precision, recall, f1])
+    report += row_fmt.format(
+        "macro avg", *scores.mean(axis=1), total, width=width, digits=digits
+    )
+    report += row_fmt.format(
+        "weighted avg", *(scores @ support / total), total, width=width, digits=digits
+    )
+    return report
 
 
 def main():
@@ -65,12 +124,14 @@ def main():
     print(f"Evaluating {len(filtered_gold)} examples "
           f"({len(gold) - len(filtered_gold)} skipped due to empty gold labels).\n")
 
-    print("Accuracy:", accuracy_score(filtered_gold, filtered_predicted))
+    labels, cm = confusion_matrix(filtered_gold, filtered_predicted)
+
+    print("Accuracy:", np.trace(cm) / cm.sum())
     print()
     print("Classification report:")
-    print(classification_report(filtered_gold, filtered_predicted))
+    print(classification_report(labels, cm))
     print("Confusion matrix:")
-    print(confusion_matrix(filtered_gold, filtered_predicted))
+    print(cm)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,2 @@
+# Plain unittest runs do not load conftest.py; install the udapi stub here.
+from . import _udapi_stub  # noqa: F401
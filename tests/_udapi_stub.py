@@ -0,0 +1,19 @@
+import sys
+import types
+
+
+# Minimal stand-in for udapi so the block can be imported without it.
+if "udapi" not in sys.modules:
+    udapi = types.ModuleType("udapi")
+    core = types.ModuleType("udapi.core")
+    block_mod = types.ModuleType("udapi.core.block")
+
+    class Block:  # pragma: no cover
+        pass
+
+    block_mod.Block = Block
+    core.block = block_mod
+    udapi.core = core
+    sys.modules["udapi"] = udapi
+    sys.modules["udapi.core"] = core
+    sys.modules["udapi.core.block"] = block_mod
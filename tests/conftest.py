@@ -0,0 +1 @@
+from . import _udapi_stub  # noqa: F401
@@ -1,27 +1,33 @@
-import sys
-import types
+import contextlib
+import io
 import unittest
+from unittest import mock
 
+if __name__ == "__main__":
+    # Run as a script, the tests package (and so the udapi stub) is not loaded.
+    import tests._udapi_stub  # noqa: F401
 
-if "udapi" not in sys.modules:
-    udapi = types.ModuleType("udapi")
-    core = types.ModuleType("udapi.core")
-    block_mod = types.ModuleType("udapi.core.block")
+from clitics.cliticfeats import CliticFeats
 
-    class Block:  # pragma: no cover
-        pass
 
-    block_mod.Block = Block
-    core.block = block_mod
-    udapi.core = core
-    sys.modules["udapi"] = udapi
-    sys.modules["udapi.core"] = core
-    sys.modules["udapi.core.block"] = block_mod
+class FakeListOfNodes(list):
+    """Stand-in for udapi's ListOfNodes, which can be called with add_self."""
 
-from clitics.cliticfeats import CliticFeats
+    def __init__(self, nodes, origin):
+        super().__init__(nodes)
+        self.origin = origin
+
+    def __call__(self, add_self=False):
+        if not add_self:
+            return self
+        return sorted([self.origin, *self], key=lambda n: n.ord)
 
 
 class FakeNode:
+    __slots__ = (
+        "form", "lemma", "ord", "upos", "deprel", "feats", "parent", "children", "_is_root"
+    )
+
     def __init__(
         self, form, ord_, upos="X", deprel="", lemma=None, feats="_", is_root=False
     ):
@@ -43,100 +49,291 @@ class FakeNode:
     def is_root(self):
         return self._is_root
 
-    def __hash__(self):
-        return id(self)
+    @property
+    def root(self):
+        node = self
+        while not node.is_root():
+            node = node.parent
+        return node
 
+    @property
+    def descendants(self):
+        nodes = []
+        stack = list(self.children)
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(node.children)
+        nodes.sort(key=lambda n: n.ord)
+        return FakeListOfNodes(nodes, self)
 
-class CliticFeatsTests(unittest.TestCase):
-    def test_clause_position_uses_full_clitic_group(self):
-        root = FakeNode("<root>", 0, is_root=True)
-        pred = root.add_child(
-            FakeNode("četl", 1, upos="VERB", deprel="root", lemma="číst")
+
+class FakeRoot(FakeNode):
+    __slots__ = ("sent_id",)
+
+    def __init__(self, sent_id=None):
+        super().__init__("<root>", 0, is_root=True)
+        self.sent_id = sent_id
+
+
+def _build_ho_se_tree():
+    """Return ``(pred, se)`` for *četl ho se*."""
+    root = FakeRoot("s1")
+    pred = root.add_child(
+        FakeNode("četl", 1, upos="VERB", deprel="root", lemma="číst")
+    )
+    pred.add_child(
+        FakeNode(
+            "ho",
+            2,
+            upos="PRON",
+            deprel="obj",
+            lemma="on",
+            feats="Case=Acc|Variant=Short",
         )
-        pred.add_child(
-            FakeNode(
-                "ho",
-                2,
-                upos="PRON",
-                deprel="obj",
-                lemma="on",
-                feats="Case=Acc|Variant=Short",
-            )
+    )
+    se = pred.add_child(
+        FakeNode(
+            "se",
+            3,
+            upos="PRON",
+            deprel="expl:pv",
+            lemma="se",
+            feats="PronType=Prs|Reflex=Yes|Variant=Short",
+        )
+    )
+    return pred, se
+
+
+def _build_si_jsem_tree():
+    """Return ``(pred, se)`` for *on si jsem četl*."""
+    root = FakeRoot("s1")
+    pred = root.add_child(
+        FakeNode("četl", 4, upos="VERB", deprel="root", lemma="číst")
+    )
+    pred.add_child(FakeNode("on", 1, upos="PRON", deprel="nsubj", lemma="on"))
+    se = pred.add_child(
+        FakeNode(
+            "si",
+            2,
+            upos="PRON",
+            deprel="expl:pv",
+            lemma="se",
+            feats="Case=Dat|PronType=Prs|Reflex=Yes|Variant=Short",
         )
-        se = pred.add_child(
+    )
+    pred.add_child(
+        FakeNode(
+            "jsem",
+            3,
+            upos="AUX",
+            deprel="aux",
+            lemma="být",
+            feats="Mood=Ind|Person=1|Tense=Pres|VerbForm=Fin",
+        )
+    )
+    return pred, se
+
+
+def _build_mi_se_tree():
+    """Return ``(pred, se)`` for *mi se četl*."""
+    root = FakeRoot("s1")
+    pred = root.add_child(
+        FakeNode("četl", 3, upos="VERB", deprel="root", lemma="číst")
+    )
+    pred.add_child(
+        FakeNode(
+            "mi",
+            1,
+            upos="PRON",
+            deprel="iobj",
+            lemma="já",
+            feats="Case=Dat|Variant=Short",
+        )
+    )
+    se = pred.add_child(
+        FakeNode(
+            "se",
+            2,
+            upos="PRON",
+            deprel="expl:pv",
+            lemma="se",
+            feats="Case=Acc|PronType=Prs|Reflex=Yes|Variant=Short",
+        )
+    )
+    return pred, se
+
+
+def _build_xcomp_tree():
+    """Return ``(pred, se)`` for *musí se o zeď opírat* (se under the xcomp)."""
+    root = FakeRoot("s1")
+    head = root.add_child(
+        FakeNode("musí", 1, upos="VERB", deprel="root", lemma="muset")
+    )
+    pred = head.add_child(
+        FakeNode("opírat", 5, upos="VERB", deprel="xcomp", lemma="opírat")
+    )
+    se = pred.add_child(
+        FakeNode(
+            "se",
+            2,
+            upos="PRON",
+            deprel="expl:pv",
+            lemma="se",
+            feats="PronType=Prs|Reflex=Yes|Variant=Short",
+        )
+    )
+    wall = pred.add_child(FakeNode("zeď", 4, upos="NOUN", deprel="obl", lemma="zeď"))
+    wall.add_child(FakeNode("o", 3, upos="ADP", deprel="case", lemma="o"))
+    return pred, se
+
+
+def _build_root_se_tree():
+    """Return the root of a sentence whose only token *se* hangs on the root."""
+    root = FakeRoot("s2")
+    root.add_child(
+        FakeNode(
+            "Se",
+            1,
+            upos="PRON",
+            deprel="root",
+            lemma="se",
+            feats="PronType=Prs|Reflex=Yes|Variant=Short",
+        )
+    )
+    return root
+
+
+def _build_two_se_tree():
+    """Return the root of *Bojí se a směje se* (one se per conjunct)."""
+    root = FakeRoot("s3")
+    head = root.add_child(
+        FakeNode("Bojí", 1, upos="VERB", deprel="root", lemma="bát")
+    )
+    conj = head.add_child(
+        FakeNode("směje", 4, upos="VERB", deprel="conj", lemma="smát")
+    )
+    conj.add_child(FakeNode("a", 3, upos="CCONJ", deprel="cc", lemma="a"))
+    for verb, ord_ in ((head, 2), (conj, 5)):
+        verb.add_child(
             FakeNode(
                 "se",
-                3,
+                ord_,
                 upos="PRON",
                 deprel="expl:pv",
                 lemma="se",
                 feats="PronType=Prs|Reflex=Yes|Variant=Short",
             )
         )
+    return root
+
+
+class CliticFeatsTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # The trees are only read by the tests, so they are built once.
+        cls.ho_se_tree = _build_ho_se_tree()
+        cls.si_jsem_tree = _build_si_jsem_tree()
+        cls.mi_se_tree = _build_mi_se_tree()
+        cls.xcomp_tree = _build_xcomp_tree()
 
+    def test_clause_position_uses_full_clitic_group(self):
+        pred, se = self.ho_se_tree
         group = CliticFeats._clitic_group(se, pred)
-        self.assertEqual([n.form for n in group], ["ho", "se"])
+        self.assertEqual(tuple(n.form for n in group), ("ho", "se"))
         self.assertEqual(CliticFeats._clause_position(pred, group), "postiniciální")
 
     def test_relation_to_regent_uses_full_clitic_group(self):
-        root = FakeNode("<root>", 0, is_root=True)
-        pred = root.add_child(
-            FakeNode("četl", 4, upos="VERB", deprel="root", lemma="číst")
-        )
-        pred.add_child(FakeNode("on", 1, upos="PRON", deprel="nsubj", lemma="on"))
-        se = pred.add_child(
-            FakeNode(
-                "si",
-                2,
-                upos="PRON",
-                deprel="expl:pv",
-                lemma="se",
-                feats="Case=Dat|PronType=Prs|Reflex=Yes|Variant=Short",
-            )
-        )
-        pred.add_child(
-            FakeNode(
-                "jsem",
-                3,
-                upos="AUX",
-                deprel="aux",
-                lemma="být",
-                feats="Mood=Ind|Person=1|Tense=Pres|VerbForm=Fin",
-            )
-        )
-
+        pred, se = self.si_jsem_tree
         group = CliticFeats._clitic_group(se, pred)
-        self.assertEqual([n.form for n in group], ["si", "jsem"])
+        self.assertEqual(tuple(n.form for n in group), ("si", "jsem"))
         self.assertEqual(CliticFeats._relation_to_regent(pred, group), "kontaktní preverbální")
 
     def test_group_accepts_inflected_pronoun_clitic(self):
-        root = FakeNode("<root>", 0, is_root=True)
-        pred = root.add_child(
-            FakeNode("četl", 3, upos="VERB", deprel="root", lemma="číst")
+        pred, se = self.mi_se_tree
+        group = CliticFeats._clitic_group(se, pred)
+        self.assertEqual(tuple(n.form for n in group), ("mi", "se"))
+
+    def test_clause_spans_xcomp_head_subtree_in_order(self):
+        pred, se = self.xcomp_tree
+        clause_nodes = CliticFeats._clause_nodes(pred)
+        self.assertEqual(
+            tuple(n.form for n in clause_nodes), ("musí", "se", "o", "zeď", "opírat")
         )
-        pred.add_child(
-            FakeNode(
-                "mi",
-                1,
-                upos="PRON",
-                deprel="iobj",
-                lemma="já",
-                feats="Case=Dat|Variant=Short",
-            )
+        self.assertEqual(CliticFeats._predicate_form(pred), "musí opírat")
+        self.assertEqual(CliticFeats._clause_position(pred, [se]), "postiniciální")
+
+    def test_parent_cycle_collects_each_predicate_node_once(self):
+        a, b, c = (
+            FakeNode(form, ord_, upos="VERB", deprel="xcomp")
+            for form, ord_ in (("A", 1), ("B", 2), ("C", 3))
         )
-        se = pred.add_child(
-            FakeNode(
-                "se",
-                2,
-                upos="PRON",
-                deprel="expl:pv",
-                lemma="se",
-                feats="Case=Acc|PronType=Prs|Reflex=Yes|Variant=Short",
-            )
+        b.add_child(a)
+        c.add_child(b)
+        a.add_child(c)
+        self.assertEqual(CliticFeats._predicate_form(a), "A B C")
+        self.assertEqual(CliticFeats._clause_type(a), "HV")
+
+
+class CliticFeatsBlockTests(unittest.TestCase):
+    HEADER = (
+        "sent_id\tord\tsentence\tpredicate_form\tclause_type\t"
+        "clause_position\trelation_to_regent"
+    )
+
+    @classmethod
+    def setUpClass(cls):
+        cls.trees = (
+            _build_ho_se_tree()[0].root,
+            _build_root_se_tree(),
+            _build_two_se_tree(),
         )
 
-        group = CliticFeats._clitic_group(se, pred)
-        self.assertEqual([n.form for n in group], ["mi", "se"])
+    def _run(self, trees):
+        out = io.StringIO()
+        block = CliticFeats()
+        with contextlib.redirect_stdout(out):
+            block.process_start()
+            for tree in trees:
+                block.process_tree(tree)
+            before_end = out.getvalue()
+            block.process_end()
+        return before_end, out.getvalue()
+
+    def test_rows(self):
+        _, output = self._run(self.trees)
+        self.assertEqual(
+            output.splitlines(),
+            [
+                self.HEADER,
+                "s1\t3\tčetl ho <se>\tčetl\tHV\tpostiniciální\tkontaktní postverbální",
+                "s2\t1\t<Se>\t_\t_\t_\t_",
+                "s3\t2\tBojí <se> a směje se\tBojí\tHV\tpostiniciální\t"
+                "kontaktní postverbální",
+                "s3\t5\tBojí se a směje <se>\tsměje\tHV\tDelP: finální\t"
+                "kontaktní postverbální",
+            ],
+        )
+
+    def test_rows_are_written_at_process_end(self):
+        before_end, output = self._run(self.trees)
+        self.assertEqual(before_end, self.HEADER + "\n")
+        self.assertEqual(len(output.splitlines()), 5)
+
+    def test_block_works_without_process_start(self):
+        out = io.StringIO()
+        block = CliticFeats()
+        with contextlib.redirect_stdout(out):
+            block.process_tree(_build_root_se_tree())
+            block.process_end()
+        self.assertEqual(out.getvalue(), "s2\t1\t<Se>\t_\t_\t_\t_\n")
+
+    def test_full_buffer_is_written_early(self):
+        with mock.patch("clitics.cliticfeats._FLUSH_EVERY", 3):
+            before_end, output = self._run(self.trees)
+        # Header plus the first three rows; the fourth waits for process_end.
+        self.assertEqual(before_end, "".join(output.splitlines(True)[:4]))
+        self.assertEqual(len(output.splitlines()), 5)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from evaluate import classification_report, confusion_matrix, read_labels
+
+
+def _report(gold, predicted):
+    labels, cm = confusion_matrix(gold, predicted)
+    return classification_report(labels, cm)
+
+
+class ReadLabelsTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        fd, cls.path = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write("a\nb\n\nd\ne\n")
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.path)
+
+    def test_no_skip(self):
+        self.assertEqual(read_labels(self.path, []), ["a", "b", "", "d", "e"])
+
+    def test_skip_lines(self):
+        self.assertEqual(read_labels(self.path, [0, 3]), ["b", "", "e"])
+
+    def test_skip_lines_out_of_range_are_ignored(self):
+        self.assertEqual(read_labels(self.path, [-3, 9]), ["a", "b", "", "d", "e"])
+        self.assertEqual(read_labels(self.path, [-3, 1]), ["a", "", "d", "e"])
+
+
+class ConfusionMatrixTests(unittest.TestCase):
+    def test_rows_are_gold_and_columns_are_predicted(self):
+        labels, cm = confusion_matrix(["a", "a", "b"], ["a", "b", "b"])
+        self.assertEqual(labels, ["a", "b"])
+        self.assertEqual(cm.tolist(), [[1, 1], [0, 1]])
+
+    def test_label_only_in_predictions_gets_row_and_column(self):
+        labels, cm = confusion_matrix(["a", "a"], ["a", "c"])
+        self.assertEqual(labels, ["a", "c"])
+        self.assertEqual(cm.tolist(), [[1, 1], [0, 0]])
+
+    def test_empty_prediction_is_a_label(self):
+        labels, cm = confusion_matrix(["a", "b"], ["a", ""])
+        self.assertEqual(labels, ["", "a", "b"])
+        self.assertEqual(cm.tolist(), [[0, 0, 0], [0, 1, 0], [1, 0, 0]])
+
+
+class ClassificationReportTests(unittest.TestCase):
+    def test_report_layout(self):
+        expected = (
+            "              precision    recall  f1-score   support\n"
+            "\n"
+            "           x       1.00      0.67      0.80         3\n"
+            "           y       0.50      0.50      0.50         2\n"
+            "           z       0.50      1.00      0.67         1\n"
+            "\n"
+            "    accuracy                           0.67         6\n"
+            "   macro avg       0.67      0.72      0.66         6\n"
+            "weighted avg       0.75      0.67      0.68         6\n"
+        )
+        report = _report(["x", "x", "x", "y", "y", "z"], ["x", "x", "y", "y", "z", "z"])
+        self.assertEqual(report, expected)
+
+    def test_f1_half_way_case_rounds_like_sklearn(self):
+        # Class a has tp=3, fp=3, fn=7, so F1 is exactly 0.375.
+        report = _report(["a"] * 10 + ["b"] * 3, ["a"] * 3 + ["b"] * 7 + ["a"] * 3)
+        self.assertIn(
+            "           a       0.50      0.30      0.38        10\n", report
+        )
+
+    def test_class_without_predictions_scores_zero(self):
+        with np.errstate(all="raise"):
+            report = _report(["a", "b"], ["a", "a"])
+        self.assertIn(
+            "           b       0.00      0.00      0.00         1\n", report
+        )
+
+    def test_label_only_in_predictions_has_zero_support(self):
+        with np.errstate(all="raise"):
+            report = _report(["a", "a"], ["a", "c"])
+        self.assertIn(
+            "           c       0.00      0.00      0.00         0\n", report
+        )
+        self.assertIn(
+            "    accuracy                           0.50         2\n", report
+        )
+
+    def test_empty_prediction_is_reported(self):
+        report = _report(["a", "b"], ["a", ""])
+        # The empty label sorts first, so its row follows the header.
+        self.assertEqual(
+            report.splitlines()[2],
+            "                   0.00      0.00      0.00         0",
+        )
+        self.assertIn(
+            "           b       0.00      0.00      0.00         1\n", report
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()